@@ -11,32 +11,29 @@ Usage:
 
     # Post immediately
     python add_post.py --text "Post text" --now
+
+    # Album: several images sent as one media group (caption on the first)
+    python add_post.py --text "Post text" --image a.png --image b.png
+
+    # Only show similar queued/posted posts, don't add
+    python add_post.py --text "Post text" --similar
 """
 
 import argparse
-import json
 import random
 import sys
+import uuid
 from datetime import datetime, timedelta
 from pathlib import Path
 from zoneinfo import ZoneInfo
 
-from config import QUEUE_FILE, TIMEZONE
-
-
-def load_queue() -> dict:
-    """Load queue from JSON file."""
-    if not Path(QUEUE_FILE).exists():
-        return {"posts": []}
-
-    with open(QUEUE_FILE, 'r', encoding='utf-8') as f:
-        return json.load(f)
+from config import TIMEZONE
+from image_index import dhash, get_image_index, local_photo_paths, save_image_index
+from queue_store import locked_queue
+from text_index import DUPLICATE_SIMILARITY, get_text_index, minhash, queued_key, save_text_index
 
-
-def save_queue(queue: dict) -> None:
-    """Save queue to JSON file."""
-    with open(QUEUE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(queue, f, ensure_ascii=False, indent=2)
+# Telegram limit for sendMediaGroup
+MEDIA_GROUP_LIMIT = 10
 
 
 def get_next_id(queue: dict) -> int:
@@ -76,58 +73,164 @@ def get_next_available_slot(queue: dict) -> datetime:
     )
 
 
-def add_post(text: str, image_url: str = None, scheduled: str = None, now: bool = False) -> dict:
-    """Add post to queue."""
-    queue = load_queue()
-
-    # Determine scheduled time
-    if now:
-        scheduled_dt = datetime.now(ZoneInfo(TIMEZONE))
-    elif scheduled:
-        scheduled_dt = datetime.fromisoformat(scheduled)
-        if scheduled_dt.tzinfo is None:
-            scheduled_dt = scheduled_dt.replace(tzinfo=ZoneInfo(TIMEZONE))
-    else:
-        # Auto-schedule to next available morning slot
-        scheduled_dt = get_next_available_slot(queue)
-
-    post = {
-        "id": get_next_id(queue),
-        "scheduled": scheduled_dt.isoformat(),
-        "text": text,
-        "image_url": image_url,
-        "status": "pending",
-        "created_at": datetime.now(ZoneInfo(TIMEZONE)).isoformat()
-    }
-
-    queue["posts"].append(post)
-    save_queue(queue)
+def build_media(images: list = None, documents: list = None) -> list:
+    """Build ordered media list from image and document paths/URLs."""
+    media = [{"type": "photo", "source": src} for src in images or []]
+    media += [{"type": "document", "source": src} for src in documents or []]
+    return media
+
+
+def validate_media(media: list) -> None:
+    """Check that media list can be delivered in one sendMediaGroup call."""
+    if len(media) > MEDIA_GROUP_LIMIT:
+        raise ValueError(f"Too many media items: {len(media)} (max {MEDIA_GROUP_LIMIT})")
+
+    # Telegram only groups documents with documents
+    types = {item["type"] for item in media}
+    if len(media) > 1 and "document" in types and len(types) > 1:
+        raise ValueError("Documents can't be mixed with photos in one album")
+
+
+def add_post(text: str, image_url: str = None, scheduled: str = None, now: bool = False,
+             media: list = None) -> dict:
+    """Add post to queue.
+
+    image_url is a shortcut for a single photo; media is an ordered list of
+    {"type": "photo" | "document", "source": path or URL} items.
+    """
+    media = list(media or [])
+    if image_url:
+        media.insert(0, {"type": "photo", "source": image_url})
+    validate_media(media)
+
+    # Hash outside the queue lock, posters wait on it
+    hashes = hash_images(local_photo_paths({"media": media}))
+    signature = minhash(text)
+
+    with locked_queue() as queue:
+        # Determine scheduled time
+        if now:
+            scheduled_dt = datetime.now(ZoneInfo(TIMEZONE))
+        elif scheduled:
+            scheduled_dt = datetime.fromisoformat(scheduled)
+            if scheduled_dt.tzinfo is None:
+                scheduled_dt = scheduled_dt.replace(tzinfo=ZoneInfo(TIMEZONE))
+        else:
+            # Auto-schedule to next available morning slot
+            scheduled_dt = get_next_available_slot(queue)
+
+        post = {
+            "id": get_next_id(queue),
+            "scheduled": scheduled_dt.isoformat(),
+            "text": text,
+            "image_url": media[0]["source"] if media and media[0]["type"] == "photo" else None,
+            "media": media,
+            "status": "pending",
+            # Identifies this delivery across workers and retries
+            "idempotency_key": uuid.uuid4().hex,
+            "created_at": datetime.now(ZoneInfo(TIMEZONE)).isoformat()
+        }
+
+        queue["posts"].append(post)
+
+        # Duplicate indexes are advisory, a failure here must not lose the post
+        try:
+            index_post_images(post, hashes)
+            index_post_text(post, signature)
+        except Exception as e:
+            print(f"⚠ Failed to update duplicate indexes: {e}")
 
     return post
 
 
+def hash_images(paths: list) -> dict:
+    """Perceptual hashes of existing local images, path -> hash."""
+    hashes = {}
+    for path in paths:
+        if not Path(path).exists():
+            continue
+        try:
+            hashes[path] = dhash(path)
+        except Exception as e:
+            print(f"⚠ Can't hash {path}, duplicate check skipped: {e}")
+    return hashes
+
+
+def index_post_images(post: dict, hashes: dict) -> None:
+    """Add local post images to the image index, warn about near-duplicates."""
+    index = get_image_index()
+    for path, value in hashes.items():
+        # Look up before inserting, so the same file of another post shows up
+        for match in index.find_similar(value, exclude_post_id=post["id"]):
+            print(f"⚠ {path} looks like image of post #{match['post_id']} "
+                  f"({match['status']}, distance {match['distance']}): {match['path']}")
+        index.add(path, post["id"], value=value)
+    save_image_index(index)
+
+
+def index_post_text(post: dict, signature: list) -> None:
+    """Add post text to the text index (image-only posts are skipped)."""
+    if signature is None:
+        return
+    index = get_text_index()
+    index.add(queued_key(post["id"]), post["text"], post["id"], signature=signature)
+    save_text_index(index)
+
+
+def find_similar_posts(text: str, limit: int = 5, min_similarity: float = 0.0) -> list:
+    """Find queued and posted posts similar to text, most similar first."""
+    return get_text_index().find_similar(text, limit=limit, min_similarity=min_similarity)
+
+
+def print_similar_posts(matches: list) -> None:
+    """Print similar posts with similarity scores."""
+    for match in matches:
+        print(f"  {match['similarity']:.0%}  #{match['post_id']} ({match['status']})  "
+              f"{match['preview'][:50]}...")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Add post to @sys_adm channel queue")
     parser.add_argument("--text", "-t", required=True, help="Post text")
-    parser.add_argument("--image", "-i", help="Image URL or local file path")
+    parser.add_argument("--image", "-i", action="append", default=[],
+                        help="Image URL or local file path (repeat for an album)")
+    parser.add_argument("--document", "-d", action="append", default=[],
+                        help="Document URL or local file path (repeat for an album)")
     parser.add_argument("--schedule", "-s", help="Scheduled time (ISO format: 2026-02-05T07:30)")
     parser.add_argument("--now", "-n", action="store_true", help="Post immediately")
+    parser.add_argument("--similar", action="store_true",
+                        help="Only list similar queued/posted posts, don't add")
 
     args = parser.parse_args()
 
-    post = add_post(
-        text=args.text,
-        image_url=args.image,
-        scheduled=args.schedule,
-        now=args.now
-    )
+    if args.similar:
+        matches = find_similar_posts(args.text)
+        if not matches:
+            print("✓ No similar posts")
+        print_similar_posts(matches)
+        return
+
+    duplicates = find_similar_posts(args.text, min_similarity=DUPLICATE_SIMILARITY)
+
+    try:
+        post = add_post(
+            text=args.text,
+            scheduled=args.schedule,
+            now=args.now,
+            media=build_media(args.image, args.document)
+        )
+    except ValueError as e:
+        parser.error(str(e))
 
     print(f"✓ Post added to queue:")
     print(f"  ID: {post['id']}")
     print(f"  Scheduled: {post['scheduled']}")
     print(f"  Text: {post['text'][:50]}...")
-    if post['image_url']:
-        print(f"  Image: {post['image_url'][:50]}...")
+    for item in post['media']:
+        print(f"  {item['type'].capitalize()}: {item['source'][:50]}...")
+    if duplicates:
+        print("⚠ Similar posts already exist:")
+        print_similar_posts(duplicates)
 
 
 if __name__ == "__main__":
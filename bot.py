@@ -9,7 +9,7 @@ Features:
 """
 
 import asyncio
-import json
+from html import escape
 import logging
 from datetime import datetime
 from pathlib import Path
@@ -22,7 +22,10 @@ from aiogram.types import (
 )
 from zoneinfo import ZoneInfo
 
-from config import BOT_TOKEN, QUEUE_FILE, TIMEZONE
+from config import BOT_TOKEN, IMAGES_DIR, TIMEZONE
+from image_index import dhash, get_image_index, save_image_index
+from queue_store import has_active_lease, load_queue, queue_lock, save_queue
+from text_index import get_text_index
 
 # Setup logging
 logging.basicConfig(
@@ -36,9 +39,15 @@ bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher()
 
 # Images directory
-IMAGES_DIR = Path("/opt/lifecoach/sys-adm-bot/images")
+IMAGES_DIR = Path(IMAGES_DIR)
 IMAGES_DIR.mkdir(exist_ok=True)
 
+# Telegram delivers album photos as separate messages; wait this long for the rest
+ALBUM_COLLECT_DELAY = 1.0
+
+# Album photos collected so far: media_group_id -> [(message_id, file_id, file_unique_id)]
+dp["album_buffer"] = {}
+
 # Admin ID (only you can use this bot)
 ADMIN_ID = 219787633  # Alex's Telegram ID
 
@@ -53,24 +62,18 @@ MAIN_MENU = ReplyKeyboardMarkup(
 )
 
 
-def load_queue() -> dict:
-    """Load queue from JSON file."""
-    if not Path(QUEUE_FILE).exists():
-        return {"posts": []}
-    with open(QUEUE_FILE, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-
-def save_queue(queue: dict) -> None:
-    """Save queue to JSON file."""
-    with open(QUEUE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(queue, f, ensure_ascii=False, indent=2)
-
-
 def get_pending_posts() -> list:
-    """Get list of pending posts."""
+    """Get list of pending posts, except ones a poster is sending right now."""
     queue = load_queue()
-    return [p for p in queue.get("posts", []) if p.get("status") == "pending"]
+    return [
+        p for p in queue.get("posts", [])
+        if p.get("status") == "pending" and not has_active_lease(p)
+    ]
+
+
+def has_media(post: dict) -> bool:
+    """Check if post has any media attached (album or legacy image_url)."""
+    return bool(post.get("media") or post.get("image_url"))
 
 
 def format_post_preview(post: dict, short: bool = False) -> str:
@@ -83,10 +86,71 @@ def format_post_preview(post: dict, short: bool = False) -> str:
             scheduled = dt.strftime("%d.%m %H:%M")
         except:
             pass
-    has_image = "🖼" if post.get("image_url") else "📝"
+    has_image = "🖼" if has_media(post) else "📝"
     return f"{has_image} {scheduled}: {text}..."
 
 
+def find_duplicate_images(post_id: int, hashes: list) -> list:
+    """Find indexed images that look like the ones being attached."""
+    index = get_image_index()
+    duplicates = []
+    for value in hashes:
+        # Re-attaching to the same queued post is not a duplicate
+        duplicates += index.find_similar(value, exclude_post_id=post_id)
+    return duplicates
+
+
+def attach_error(post: dict) -> str:
+    """Why post can't take new media, None if it can."""
+    if post is None or post.get("status") != "pending" or has_active_lease(post):
+        return "уже публикуется или удалён"
+    if has_media(post):
+        return "уже с картинкой"
+    return None
+
+
+def link_media(post_id: int, media: list, hashes: list) -> str:
+    """Attach media to queued post and add photos to the image index.
+
+    Blocks on the queue lock, call via asyncio.to_thread. Returns None on
+    success, otherwise why the post can't take the media.
+    """
+    with queue_lock():
+        queue = load_queue()
+        post = next((p for p in queue.get("posts", []) if p.get("id") == post_id), None)
+        error = attach_error(post)
+        if error:
+            return error
+
+        post["media"] = media
+        post["image_url"] = media[0]["source"]
+        save_queue(queue)
+
+        index = get_image_index()
+        for item, value in zip(media, hashes):
+            index.add(item["source"], post_id, value=value)
+        save_image_index(index)
+
+    return None
+
+
+def format_attached(post_id: int, media: list) -> str:
+    """Format attach confirmation."""
+    what = f"Альбом из {len(media)} фото привязан" if len(media) > 1 else "Картинка привязана"
+    return f"✅ {what} к посту <b>#{post_id}</b>"
+
+
+async def reject_attach(callback: types.CallbackQuery, post_id: int, media: list, error: str) -> None:
+    """Drop downloaded photos of a post that can't take them anymore."""
+    for item in media:
+        Path(item["source"]).unlink(missing_ok=True)
+    await callback.message.edit_text(
+        f"❌ Пост <b>#{post_id}</b> {error}, картинка не привязана",
+        parse_mode="HTML"
+    )
+    await callback.answer()
+
+
 # ==================== HANDLERS ====================
 
 @dp.message(Command("start"))
@@ -98,12 +162,46 @@ async def cmd_start(message: types.Message):
         "👋 <b>Sys-Adm Bot</b>\n\n"
         "Управление каналом @sys_adm\n\n"
         "📸 <b>Картинки:</b> просто скинь фото\n"
-        "✍️ <b>Проверка:</b> ответь на текст кнопкой",
+        "✍️ <b>Проверка:</b> ответь на текст кнопкой\n"
+        "🔎 <b>Повторы:</b> /similar текст",
         parse_mode="HTML",
         reply_markup=MAIN_MENU
     )
 
 
+@dp.message(Command("similar"))
+async def cmd_similar(message: types.Message):
+    """Show queued and posted posts most similar to a text."""
+    if message.from_user.id != ADMIN_ID:
+        return
+
+    # Text after the command or the replied message
+    text = message.text.partition(" ")[2].strip()
+    if not text and message.reply_to_message:
+        text = message.reply_to_message.text or message.reply_to_message.caption or ""
+
+    if not text:
+        await message.answer(
+            "🔎 Напиши <code>/similar текст</code> или ответь командой на сообщение",
+            parse_mode="HTML",
+            reply_markup=MAIN_MENU
+        )
+        return
+
+    matches = await asyncio.to_thread(lambda: get_text_index().find_similar(text, limit=5))
+    if not matches:
+        await message.answer("✅ Похожих постов нет", reply_markup=MAIN_MENU)
+        return
+
+    response = "🔎 <b>Похожие посты:</b>\n\n"
+    for match in matches:
+        status = "опубликован" if match["status"] == "posted" else "в очереди"
+        response += f"<b>{match['similarity']:.0%}</b> | #{match['post_id']} ({status})\n"
+        response += f"<i>{escape(match['preview'][:60])}...</i>\n\n"
+
+    await message.answer(response, parse_mode="HTML", reply_markup=MAIN_MENU)
+
+
 @dp.message(F.text == "📋 Очередь")
 async def btn_queue(message: types.Message):
     if message.from_user.id != ADMIN_ID:
@@ -117,7 +215,9 @@ async def btn_queue(message: types.Message):
     text = "📋 <b>Очередь постов:</b>\n\n"
     for post in posts:
         post_id = post.get("id")
-        has_img = "✅" if post.get("image_url") else "❌"
+        has_img = "✅" if has_media(post) else "❌"
+        if len(post.get("media") or []) > 1:
+            has_img += f" ({len(post['media'])})"
         scheduled = post.get("scheduled", "")
         try:
             dt = datetime.fromisoformat(scheduled)
@@ -138,7 +238,7 @@ async def btn_prompts(message: types.Message):
         return
 
     posts = get_pending_posts()
-    posts_without_images = [p for p in posts if not p.get("image_url")]
+    posts_without_images = [p for p in posts if not has_media(p)]
 
     if not posts_without_images:
         await message.answer("✅ Все посты уже с картинками!", reply_markup=MAIN_MENU)
@@ -218,7 +318,7 @@ async def btn_status(message: types.Message):
 
     posts = get_pending_posts()
     total = len(posts)
-    with_images = len([p for p in posts if p.get("image_url")])
+    with_images = len([p for p in posts if has_media(p)])
     without_images = total - with_images
 
     # Next post
@@ -250,8 +350,22 @@ async def handle_photo(message: types.Message):
     if message.from_user.id != ADMIN_ID:
         return
 
+    photo = message.photo[-1]  # Highest resolution
+
+    if message.media_group_id:
+        # Collect the whole album, only the first message continues
+        album = dp["album_buffer"].setdefault(message.media_group_id, [])
+        album.append((message.message_id, photo.file_id, photo.file_unique_id))
+        if len(album) > 1:
+            return
+        await asyncio.sleep(ALBUM_COLLECT_DELAY)
+        album = dp["album_buffer"].pop(message.media_group_id)
+        photos = [(file_id, unique_id) for _, file_id, unique_id in sorted(album)]
+    else:
+        photos = [(photo.file_id, photo.file_unique_id)]
+
     posts = get_pending_posts()
-    posts_without_images = [p for p in posts if not p.get("image_url")]
+    posts_without_images = [p for p in posts if not has_media(p)]
 
     if not posts_without_images:
         await message.answer(
@@ -261,9 +375,6 @@ async def handle_photo(message: types.Message):
         )
         return
 
-    # Save photo temporarily
-    photo = message.photo[-1]  # Highest resolution
-
     # Create keyboard with post options
     keyboard = []
     for post in posts_without_images:
@@ -271,12 +382,13 @@ async def handle_photo(message: types.Message):
         callback_data = f"attach_{post['id']}"
         keyboard.append([InlineKeyboardButton(text=preview, callback_data=callback_data)])
 
-    # Store file_id in memory for callback
-    dp["pending_photo"] = photo.file_id
+    # Store file ids in memory for callback
+    dp["pending_photos"] = photos
 
     markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
+    title = f"альбом из {len(photos)} фото" if len(photos) > 1 else "картинку"
     await message.answer(
-        "🖼 <b>К какому посту привязать?</b>",
+        f"🖼 <b>К какому посту привязать {title}?</b>",
         reply_markup=markup,
         parse_mode="HTML"
     )
@@ -289,27 +401,87 @@ async def attach_photo(callback: types.CallbackQuery):
 
     # Parse post ID
     post_id = int(callback.data.split("_")[1])
-    file_id = dp.get("pending_photo")
+    photos = dp.get("pending_photos")
 
-    if not file_id:
+    if not photos:
         await callback.answer("❌ Фото не найдено, отправь заново")
         return
 
-    # Download and save photo
-    file = await bot.get_file(file_id)
-    file_path = IMAGES_DIR / f"post_{post_id}.jpg"
-    await bot.download_file(file.file_path, file_path)
+    # Stale keyboard: don't download for a post that can't take photos anymore
+    post = next((p for p in load_queue().get("posts", []) if p.get("id") == post_id), None)
+    error = attach_error(post)
+    if error:
+        await callback.message.edit_text(
+            f"❌ Пост <b>#{post_id}</b> {error}, картинка не привязана",
+            parse_mode="HTML"
+        )
+        await callback.answer()
+        return
 
-    # Update queue
-    queue = load_queue()
-    for post in queue.get("posts", []):
-        if post.get("id") == post_id:
-            post["image_url"] = str(file_path)
-            break
-    save_queue(queue)
+    # Download and save photos, keep file_id so poster can skip re-upload.
+    # Post IDs are reused once the queue empties, so file names also carry
+    # the photo's file_unique_id and never overwrite an archived image.
+    media = []
+    for file_id, unique_id in photos:
+        file = await bot.get_file(file_id)
+        file_path = IMAGES_DIR / f"post_{post_id}_{unique_id}.jpg"
+        await bot.download_file(file.file_path, file_path)
+        media.append({"type": "photo", "source": str(file_path), "file_id": file_id})
+    dp["pending_photos"] = None
+
+    # Warn before linking a picture we already have in queue or archive
+    hashes = await asyncio.to_thread(lambda: [dhash(item["source"]) for item in media])
+    duplicates = await asyncio.to_thread(find_duplicate_images, post_id, hashes)
+    if duplicates:
+        dp["pending_attach"] = {"post_id": post_id, "media": media, "hashes": hashes}
+
+        text = "⚠️ <b>Похожие картинки уже есть:</b>\n\n"
+        for match in duplicates[:10]:
+            status = "опубликован" if match["status"] == "posted" else "в очереди"
+            text += f"#{match['post_id']} ({status}), отличие {match['distance']}/64\n"
+
+        markup = InlineKeyboardMarkup(inline_keyboard=[[
+            InlineKeyboardButton(text="✅ Всё равно привязать", callback_data="attachforce"),
+            InlineKeyboardButton(text="❌ Отмена", callback_data="attachcancel"),
+        ]])
+        await callback.message.edit_text(text, reply_markup=markup, parse_mode="HTML")
+        await callback.answer("Похоже на дубликат")
+        return
+
+    error = await asyncio.to_thread(link_media, post_id, media, hashes)
+    if error:
+        await reject_attach(callback, post_id, media, error)
+        return
+
+    await callback.message.edit_text(format_attached(post_id, media), parse_mode="HTML")
+    await callback.answer("Готово!")
+
+
+@dp.callback_query(F.data.in_({"attachforce", "attachcancel"}))
+async def confirm_attach(callback: types.CallbackQuery):
+    if callback.from_user.id != ADMIN_ID:
+        return
+
+    pending = dp.get("pending_attach")
+    dp["pending_attach"] = None
+    if not pending:
+        await callback.answer("❌ Фото не найдено, отправь заново")
+        return
+
+    if callback.data == "attachcancel":
+        for item in pending["media"]:
+            Path(item["source"]).unlink(missing_ok=True)
+        await callback.message.edit_text("❌ Картинка не привязана")
+        await callback.answer()
+        return
+
+    error = await asyncio.to_thread(link_media, pending["post_id"], pending["media"], pending["hashes"])
+    if error:
+        await reject_attach(callback, pending["post_id"], pending["media"], error)
+        return
 
     await callback.message.edit_text(
-        f"✅ Картинка привязана к посту <b>#{post_id}</b>",
+        format_attached(pending["post_id"], pending["media"]),
         parse_mode="HTML"
     )
     await callback.answer("Готово!")
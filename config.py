@@ -13,6 +13,9 @@ ADMIN_ID = int(os.getenv("ADMIN_ID", "219787633"))
 # Paths
 QUEUE_FILE = "/opt/lifecoach/sys-adm-bot/queue.json"
 POSTED_DIR = "/opt/lifecoach/sys-adm-bot/posted"
+IMAGES_DIR = "/opt/lifecoach/sys-adm-bot/images"
+IMAGE_INDEX_FILE = "/opt/lifecoach/sys-adm-bot/image_index.json"
+TEXT_INDEX_FILE = "/opt/lifecoach/sys-adm-bot/text_index.json"
 LOG_FILE = "/opt/lifecoach/sys-adm-bot/bot.log"
 
 # Timezone
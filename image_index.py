@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Perceptual-hash index of queued and archived post images.
+
+Every local image gets a 64-bit dHash. Near-duplicates are found by Hamming
+distance with multi-index hashing: the hash is split into chunks with a lookup
+table each, and only entries sharing a (nearly) equal chunk are compared.
+
+Usage:
+    # Rebuild index from queue.json and posted/ archive
+    python image_index.py --rebuild
+
+    # Find images similar to a file
+    python image_index.py --query path/to/image.jpg
+"""
+
+import argparse
+import json
+import os
+from itertools import combinations
+from pathlib import Path
+
+from PIL import Image
+
+from config import IMAGE_INDEX_FILE, POSTED_DIR, QUEUE_FILE
+
+# dHash grid size: HASH_SIZE x HASH_SIZE bits
+HASH_SIZE = 8
+
+# Max Hamming distance (of 64 bits) treated as the same picture
+DUPLICATE_DISTANCE = 10
+
+# Multi-index hashing: 4 chunks of 16 bits. Two hashes within distance 10
+# have a chunk within distance 10 // 4 = 2, so probing every chunk value up
+# to 2 bit flips away finds all matches.
+HASH_CHUNKS = 4
+
+
+def dhash(image_path: str) -> int:
+    """Compute difference hash of an image."""
+    with Image.open(image_path) as img:
+        small = img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS)
+        pixels = list(small.getdata())
+
+    bits = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+def hamming(a: int, b: int) -> int:
+    """Number of differing bits between two hashes."""
+    return bin(a ^ b).count("1")
+
+
+class MultiIndex:
+    """Multi-index hashing over 64-bit hashes with Hamming distance metric."""
+
+    def __init__(self, chunks: int = HASH_CHUNKS):
+        bits = HASH_SIZE * HASH_SIZE
+        width, extra = divmod(bits, chunks)
+        # (offset, width) of each chunk
+        self.chunks = []
+        offset = 0
+        for n in range(chunks):
+            chunk_width = width + (1 if n < extra else 0)
+            self.chunks.append((offset, chunk_width))
+            offset += chunk_width
+        # One table per chunk: chunk value -> keys
+        self.tables = [{} for _ in self.chunks]
+        self.values = {}
+
+    def add(self, value: int, key: str) -> None:
+        """Insert key under hash value."""
+        self.values[key] = value
+        for table, (offset, width) in zip(self.tables, self.chunks):
+            chunk = (value >> offset) & ((1 << width) - 1)
+            table.setdefault(chunk, []).append(key)
+
+    def search(self, value: int, max_distance: int) -> list:
+        """Return [(distance, key)] within max_distance, closest first."""
+        # Pigeonhole: some chunk differs in at most this many bits
+        radius = max_distance // len(self.chunks)
+
+        candidates = set()
+        for table, (offset, width) in zip(self.tables, self.chunks):
+            chunk = (value >> offset) & ((1 << width) - 1)
+            for flips in range(radius + 1):
+                for bits in combinations(range(width), flips):
+                    probe = chunk
+                    for bit in bits:
+                        probe ^= 1 << bit
+                    candidates.update(table.get(probe, ()))
+
+        found = []
+        for key in candidates:
+            distance = hamming(value, self.values[key])
+            if distance <= max_distance:
+                found.append((distance, key))
+        return sorted(found)
+
+
+class ImageIndex:
+    """Persistent perceptual hash index of post images with near-duplicate lookup.
+
+    One file can be used by several posts, so every path keeps a list of uses.
+    """
+
+    def __init__(self, images: dict = None):
+        # path -> [{"hash": hex, "post_id": int, "status": "queued" | "posted"}]
+        self.images = {
+            path: uses if isinstance(uses, list) else [uses]
+            for path, uses in (images or {}).items()
+        }
+        self.build_lookup()
+
+    def build_lookup(self) -> None:
+        """(Re)build lookup tables from stored hashes."""
+        self.lookup = MultiIndex()
+        for path, uses in self.images.items():
+            for n, use in enumerate(uses):
+                self.lookup.add(int(use["hash"], 16), (path, n))
+
+    @classmethod
+    def load(cls) -> "ImageIndex":
+        """Load index from JSON file."""
+        if not Path(IMAGE_INDEX_FILE).exists():
+            return cls()
+        with open(IMAGE_INDEX_FILE, 'r', encoding='utf-8') as f:
+            return cls(json.load(f).get("images", {}))
+
+    def save(self) -> None:
+        """Save index to JSON file atomically."""
+        tmp_file = f"{IMAGE_INDEX_FILE}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({"images": self.images}, f, ensure_ascii=False)
+        os.replace(tmp_file, IMAGE_INDEX_FILE)
+
+    def add(self, path: str, post_id: int = None, status: str = "queued", value: int = None) -> int:
+        """Hash image (unless value is given) and record its use by a post.
+
+        A queued use of the same post is updated in place; published uses are
+        never touched.
+        """
+        if value is None:
+            value = dhash(path)
+        entry = {"hash": f"{value:016x}", "post_id": post_id, "status": status}
+
+        uses = self.images.setdefault(path, [])
+        for n, use in enumerate(uses):
+            if use["post_id"] == post_id and use["status"] == "queued":
+                changed = use["hash"] != entry["hash"]
+                uses[n] = entry
+                if changed:
+                    # File re-written with a new picture: drop the stale hash
+                    self.build_lookup()
+                return value
+
+        uses.append(entry)
+        self.lookup.add(value, (path, len(uses) - 1))
+        return value
+
+    def mark_posted(self, paths: list, post_id: int) -> None:
+        """Mark images of an archived post as posted, other posts' uses stay."""
+        for path in paths:
+            for use in self.images.get(path, []):
+                if use["post_id"] == post_id and use["status"] == "queued":
+                    use["status"] = "posted"
+
+    def find_similar(self, value: int, max_distance: int = DUPLICATE_DISTANCE,
+                     exclude_post_id: int = None) -> list:
+        """Return [{"path", "distance", "hash", "post_id", "status"}] closest first.
+
+        exclude_post_id skips queued uses of that post, e.g. the one being edited.
+        """
+        result = []
+        for distance, (path, n) in self.lookup.search(value, max_distance):
+            use = self.images[path][n]
+            if use["post_id"] == exclude_post_id and use["status"] == "queued":
+                continue
+            result.append({"path": path, "distance": distance, **use})
+        return result
+
+
+_cached_index = None
+_cached_mtime = None
+
+
+def get_image_index() -> ImageIndex:
+    """Return index, re-reading the file only when another process changed it."""
+    global _cached_index, _cached_mtime
+
+    try:
+        mtime = os.stat(IMAGE_INDEX_FILE).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+
+    if _cached_index is None or mtime != _cached_mtime:
+        _cached_index = ImageIndex.load()
+        _cached_mtime = mtime
+    return _cached_index
+
+
+def save_image_index(index: ImageIndex) -> None:
+    """Save index and remember its mtime so the cache stays valid."""
+    global _cached_index, _cached_mtime
+
+    index.save()
+    _cached_index = index
+    _cached_mtime = os.stat(IMAGE_INDEX_FILE).st_mtime_ns
+
+
+def local_photo_paths(post: dict) -> list:
+    """Local photo files of a post (URLs are not indexed)."""
+    media = post.get("media") or (
+        [{"type": "photo", "source": post["image_url"]}] if post.get("image_url") else []
+    )
+    return [
+        item["source"] for item in media
+        if item["type"] == "photo"
+        and not item["source"].startswith(('http://', 'https://'))
+    ]
+
+
+def rebuild_index() -> ImageIndex:
+    """Rebuild index from queued posts and the posted archive."""
+    posts = []
+    if Path(QUEUE_FILE).exists():
+        with open(QUEUE_FILE, 'r', encoding='utf-8') as f:
+            posts += [(p, "queued") for p in json.load(f).get("posts", [])]
+    for archive_file in sorted(Path(POSTED_DIR).glob("post_*.json")):
+        with open(archive_file, 'r', encoding='utf-8') as f:
+            posts.append((json.load(f), "posted"))
+
+    index = ImageIndex()
+    for post, status in posts:
+        for path in local_photo_paths(post):
+            if not Path(path).exists():
+                continue
+            try:
+                index.add(path, post.get("id"), status)
+            except OSError as e:
+                print(f"✗ Skipped {path}: {e}")
+
+    save_image_index(index)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perceptual-hash index of post images")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild index from queue and archive")
+    parser.add_argument("--query", "-q", help="Find images similar to this file")
+    parser.add_argument("--distance", type=int, default=DUPLICATE_DISTANCE,
+                        help=f"Max Hamming distance (default {DUPLICATE_DISTANCE})")
+
+    args = parser.parse_args()
+    if not args.rebuild and not args.query:
+        parser.error("nothing to do, use --rebuild or --query")
+
+    if args.rebuild:
+        index = rebuild_index()
+        print(f"✓ Indexed {sum(len(uses) for uses in index.images.values())} image uses")
+
+    if args.query:
+        matches = get_image_index().find_similar(dhash(args.query), args.distance)
+        if not matches:
+            print("✓ No similar images")
+        for match in matches:
+            print(f"  {match['distance']:2d}  #{match['post_id']} ({match['status']})  {match['path']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,19 +3,38 @@
 Sys-Adm Channel Poster
 Reads queue.json and posts scheduled content to @sys_adm channel.
 Run via cron every 5 minutes.
+
+Workers claim due posts through a lease stored in the queue, so overlapping
+cron runs, --workers threads and posters on other hosts sharing the same
+storage never send one post twice. A post whose worker crashed becomes
+claimable again once its lease expires.
+
+Usage:
+    python poster.py                # one worker
+    python poster.py --workers 4    # drain a backlog in parallel
 """
 
+import argparse
+import copy
 import json
 import logging
 import os
+import socket
 import sys
-from datetime import datetime
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from pathlib import Path
 
 import httpx
 from zoneinfo import ZoneInfo
 
-from config import BOT_TOKEN, CHANNEL_ID, QUEUE_FILE, POSTED_DIR, LOG_FILE, TIMEZONE
+from config import BOT_TOKEN, CHANNEL_ID, POSTED_DIR, LOG_FILE, TIMEZONE
+from image_index import get_image_index, local_photo_paths, save_image_index
+from queue_store import has_active_lease, load_queue, locked_queue, queue_lock, save_queue
+from text_index import get_text_index, posted_key, queued_key, save_text_index
 
 # Setup logging
 logging.basicConfig(
@@ -31,31 +50,53 @@ logger = logging.getLogger(__name__)
 # Telegram API
 API_URL = f"https://api.telegram.org/bot{BOT_TOKEN}"
 
+# How long a claimed post stays reserved for its worker. While the worker is
+# busy the lease is renewed every LEASE_SECONDS / 4, so slow downloads and
+# uploads keep it; only a dead or stuck worker lets it expire.
+LEASE_SECONDS = 120
+LEASE_RENEW_INTERVAL = LEASE_SECONDS / 4
 
-def load_queue() -> dict:
-    """Load queue from JSON file."""
-    if not Path(QUEUE_FILE).exists():
-        return {"posts": []}
 
-    with open(QUEUE_FILE, 'r', encoding='utf-8') as f:
-        return json.load(f)
+class LeaseLost(Exception):
+    """Another worker took over the post."""
 
 
-def save_queue(queue: dict) -> None:
-    """Save queue to JSON file."""
-    with open(QUEUE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(queue, f, ensure_ascii=False, indent=2)
+def archive_path(post: dict) -> Path:
+    """Archive file of a post, derived from its idempotency key."""
+    return Path(POSTED_DIR) / f"post_{post['idempotency_key']}.json"
 
 
-def archive_post(post: dict) -> None:
+def archive_post(post: dict) -> Path:
     """Move posted content to archive."""
     Path(POSTED_DIR).mkdir(parents=True, exist_ok=True)
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    archive_file = Path(POSTED_DIR) / f"post_{timestamp}.json"
-
-    with open(archive_file, 'w', encoding='utf-8') as f:
+    archive_file = archive_path(post)
+    tmp_file = archive_file.with_suffix(".tmp")
+    with open(tmp_file, 'w', encoding='utf-8') as f:
         json.dump(post, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, archive_file)
+
+    return archive_file
+
+
+def update_indexes(post: dict, archive_file: Path) -> None:
+    """Mark archived post as posted in image and text indexes."""
+    # Keep duplicate image lookup aware of what is already published
+    try:
+        index = get_image_index()
+        index.mark_posted(local_photo_paths(post), post.get("id"))
+        save_image_index(index)
+    except Exception as e:
+        logger.warning(f"Failed to update image index: {e}")
+
+    try:
+        index = get_text_index()
+        index.rename(queued_key(post.get("id")), posted_key(archive_file), "posted")
+        save_text_index(index)
+    except Exception as e:
+        logger.warning(f"Failed to update text index: {e}")
 
 
 def send_message(text: str) -> bool:
@@ -78,104 +119,355 @@ def send_message(text: str) -> bool:
         return False
 
 
-def send_photo(image_source: str, caption: str = None) -> bool:
-    """Send photo to channel. Supports URL or local file path."""
-    try:
-        # Check if it's a local file or URL
-        if image_source.startswith(('http://', 'https://')):
-            # Download from URL
-            img_response = httpx.get(image_source, timeout=60)
-            img_response.raise_for_status()
-            photo_data = img_response.content
-        else:
-            # Read local file
-            with open(image_source, 'rb') as f:
-                photo_data = f.read()
+def get_post_media(post: dict) -> list:
+    """Return ordered media list of a post (legacy image_url becomes one photo)."""
+    if post.get("media"):
+        return post["media"]
+    if post.get("image_url"):
+        return [{"type": "photo", "source": post["image_url"]}]
+    return []
+
+
+def read_media(source: str) -> bytes:
+    """Read media bytes. Supports URL or local file path."""
+    if source.startswith(('http://', 'https://')):
+        response = httpx.get(source, timeout=60)
+        response.raise_for_status()
+        return response.content
+
+    with open(source, 'rb') as f:
+        return f.read()
+
+
+def remember_file_id(item: dict, message: dict) -> None:
+    """Store Telegram file_id of sent media so it can be reused later."""
+    if item["type"] == "photo" and message.get("photo"):
+        item["file_id"] = message["photo"][-1]["file_id"]
+    elif item["type"] == "document" and message.get("document"):
+        item["file_id"] = message["document"]["file_id"]
 
-        # Send to Telegram
-        files = {"photo": ("image.jpg", photo_data)}
+
+def send_single_media(item: dict, caption: str = None, content: bytes = None) -> bool:
+    """Send one photo or document via sendPhoto/sendDocument.
+
+    content is the already read file, otherwise it is read from item source.
+    """
+    media_type = item["type"]
+    method = "sendPhoto" if media_type == "photo" else "sendDocument"
+    try:
         data = {"chat_id": CHANNEL_ID}
+        files = None
+        if item.get("file_id"):
+            data[media_type] = item["file_id"]
+        else:
+            filename = Path(item["source"]).name or "image.jpg"
+            if content is None:
+                content = read_media(item["source"])
+            files = {media_type: (filename, content)}
         if caption:
             data["caption"] = caption
             data["parse_mode"] = "HTML"
 
         response = httpx.post(
-            f"{API_URL}/sendPhoto",
+            f"{API_URL}/{method}",
             data=data,
             files=files,
             timeout=60
         )
         response.raise_for_status()
-        logger.info(f"Photo sent successfully")
+        remember_file_id(item, response.json()["result"])
+        logger.info(f"{media_type.capitalize()} sent successfully")
         return True
     except Exception as e:
-        logger.error(f"Failed to send photo: {e}")
+        logger.error(f"Failed to send {media_type}: {e}")
         return False
 
 
-def process_queue() -> None:
-    """Process queue and post scheduled content."""
-    queue = load_queue()
+def send_media_group(media: list, caption: str = None, contents: list = None) -> bool:
+    """Send album to channel in one sendMediaGroup request.
 
-    if not queue.get("posts"):
-        logger.debug("Queue is empty")
-        return
+    Items with a known file_id are referenced directly, the rest are uploaded
+    in the same multipart body. Caption goes on the first item. contents
+    holds already read files, parallel to media.
+    """
+    try:
+        files = {}
+        input_media = []
+        for n, item in enumerate(media):
+            entry = {"type": item["type"]}
+            if item.get("file_id"):
+                entry["media"] = item["file_id"]
+            else:
+                attach_name = f"file{n}"
+                filename = Path(item["source"]).name or f"{attach_name}.jpg"
+                content = contents[n] if contents else None
+                if content is None:
+                    content = read_media(item["source"])
+                files[attach_name] = (filename, content)
+                entry["media"] = f"attach://{attach_name}"
+            if n == 0 and caption:
+                entry["caption"] = caption
+                entry["parse_mode"] = "HTML"
+            input_media.append(entry)
 
-    now = datetime.now(ZoneInfo(TIMEZONE))
-    posts_to_remove = []
+        response = httpx.post(
+            f"{API_URL}/sendMediaGroup",
+            data={
+                "chat_id": CHANNEL_ID,
+                "media": json.dumps(input_media, ensure_ascii=False)
+            },
+            files=files or None,
+            timeout=60 + 30 * len(files)
+        )
+        response.raise_for_status()
+        for item, message in zip(media, response.json()["result"]):
+            remember_file_id(item, message)
+        logger.info(f"Media group of {len(media)} items sent successfully")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to send media group: {e}")
+        return False
 
-    for i, post in enumerate(queue["posts"]):
-        if post.get("status") != "pending":
-            continue
 
-        # Parse scheduled time
-        scheduled_str = post.get("scheduled")
-        if not scheduled_str:
-            logger.warning(f"Post {post.get('id')} has no scheduled time")
-            continue
+def send_media(media: list, caption: str = None, contents: list = None) -> bool:
+    """Send post media: single item as is, several items as one album."""
+    if len(media) == 1:
+        return send_single_media(media[0], caption, contents[0] if contents else None)
+    return send_media_group(media, caption, contents)
+
+
+def read_post_media(media: list, lease_lost: threading.Event) -> list:
+    """Read all media that must be uploaded, aborting if the lease is lost.
+
+    Returns contents parallel to media, None for items with a file_id.
+    """
+    contents = []
+    for item in media:
+        contents.append(None if item.get("file_id") else read_media(item["source"]))
+        if lease_lost.is_set():
+            raise LeaseLost("lease lost while downloading media")
+    return contents
 
+
+def worker_name(n: int = 0) -> str:
+    """Unique worker id: host, process and thread number."""
+    return f"{socket.gethostname()}-{os.getpid()}-{n}"
+
+
+def parse_scheduled(post: dict) -> datetime:
+    """Parse post scheduled time, None if missing or invalid."""
+    scheduled_str = post.get("scheduled")
+    if not scheduled_str:
+        logger.warning(f"Post {post.get('id')} has no scheduled time")
+        return None
+
+    try:
+        scheduled = datetime.fromisoformat(scheduled_str)
+    except ValueError as e:
+        logger.error(f"Invalid scheduled time for post {post.get('id')}: {e}")
+        return None
+
+    if scheduled.tzinfo is None:
+        scheduled = scheduled.replace(tzinfo=ZoneInfo(TIMEZONE))
+    return scheduled
+
+
+def claim_next_post(worker_id: str) -> dict:
+    """Atomically lease the next due post, None if nothing is due.
+
+    Posts leased by another worker are skipped until the lease expires, then
+    taken over. Returns a copy of the claimed post.
+    """
+    with queue_lock():
+        queue = load_queue()
+        now = datetime.now(ZoneInfo(TIMEZONE))
+
+        for post in queue.get("posts", []):
+            if post.get("status") != "pending":
+                continue
+
+            scheduled = parse_scheduled(post)
+            if scheduled is None or now < scheduled:
+                continue
+
+            if has_active_lease(post):
+                continue
+            if post.get("lease"):
+                logger.warning(f"Taking over expired lease of post {post.get('id')} from {post['lease']['owner']}")
+
+            # Posts queued before idempotency keys existed get one now
+            post.setdefault("idempotency_key", uuid.uuid4().hex)
+            post["lease"] = {
+                "owner": worker_id,
+                "expires_at": (now + timedelta(seconds=LEASE_SECONDS)).isoformat()
+            }
+            post["attempts"] = post.get("attempts", 0) + 1
+            save_queue(queue)
+            return copy.deepcopy(post)
+
+    return None
+
+
+def renew_lease(worker_id: str, post: dict) -> bool:
+    """Extend lease of a post, False if this worker no longer owns it."""
+    key = post["idempotency_key"]
+
+    with queue_lock():
+        queue = load_queue()
+        queued = next((p for p in queue.get("posts", []) if p.get("idempotency_key") == key), None)
+        if queued is None or queued.get("status") != "pending":
+            return False
+
+        lease = queued.get("lease") or {}
+        now = datetime.now(ZoneInfo(TIMEZONE))
+        if lease.get("owner") != worker_id or datetime.fromisoformat(lease["expires_at"]) <= now:
+            return False
+
+        lease["expires_at"] = (now + timedelta(seconds=LEASE_SECONDS)).isoformat()
+        save_queue(queue)
+        return True
+
+
+def keep_lease(worker_id: str, post: dict, stop: threading.Event, lost: threading.Event) -> None:
+    """Renew lease in background until stopped; set lost once it is gone.
+
+    Errors (e.g. a transient read failure on shared storage) are retried
+    until the last successfully renewed lease would have expired.
+    """
+    expires = time.monotonic() + LEASE_SECONDS
+    while not stop.wait(LEASE_RENEW_INTERVAL):
         try:
-            scheduled = datetime.fromisoformat(scheduled_str)
-            if scheduled.tzinfo is None:
-                scheduled = scheduled.replace(tzinfo=ZoneInfo(TIMEZONE))
-        except ValueError as e:
-            logger.error(f"Invalid scheduled time for post {post.get('id')}: {e}")
+            renewed = renew_lease(worker_id, post)
+        except Exception as e:
+            logger.error(f"Failed to renew lease of post {post.get('id')}, retrying: {e}")
+            if time.monotonic() >= expires:
+                lost.set()
+                return
             continue
 
-        # Check if it's time to post
-        if now >= scheduled:
-            logger.info(f"Posting scheduled content: {post.get('id')}")
+        if not renewed:
+            lost.set()
+            return
+        expires = time.monotonic() + LEASE_SECONDS
+
+
+def deliver_post(worker_id: str, post: dict) -> bool:
+    """Send post unless an earlier attempt with the same key already did.
+
+    The lease is renewed in the background while media downloads and the
+    upload run. Ownership is confirmed right before sending; LeaseLost is
+    raised if another worker took the post over.
+    """
+    if archive_path(post).exists():
+        # Previous worker delivered and archived, but died before finishing
+        logger.info(f"Post {post.get('id')} already delivered, skipping send")
+        return True
+
+    stop, lost = threading.Event(), threading.Event()
+    keeper = threading.Thread(target=keep_lease, args=(worker_id, post, stop, lost), daemon=True)
+    keeper.start()
+
+    try:
+        media = get_post_media(post)
+        text = post.get("text", "")
+        contents = read_post_media(media, lost)
+
+        if lost.is_set() or not renew_lease(worker_id, post):
+            raise LeaseLost("lease lost before sending")
+
+        logger.info(f"Posting scheduled content: {post.get('id')}")
+
+        success = False
+        if media:
+            success = send_media(media, text, contents)
+        elif text:
+            success = send_message(text)
 
+        if lost.is_set():
+            logger.error(f"Lease of post {post.get('id')} was lost while sending")
+    finally:
+        stop.set()
+        keeper.join()
+
+    if success:
+        post["status"] = "posted"
+        post["posted_at"] = datetime.now(ZoneInfo(TIMEZONE)).isoformat()
+        post.pop("lease", None)
+        archive_post(post)
+
+    return success
+
+
+def finish_post(worker_id: str, post: dict, success: bool) -> None:
+    """Remove delivered post from queue or mark it failed, releasing the lease."""
+    key = post["idempotency_key"]
+
+    with locked_queue() as queue:
+        posts = queue.get("posts", [])
+        index = next((i for i, p in enumerate(posts) if p.get("idempotency_key") == key), None)
+        if index is None:
+            # Another worker already finished it
+            return
+        queued = posts[index]
+
+        if success:
+            posts.pop(index)
+            update_indexes(post, archive_path(post))
+            return
+
+        owner = (queued.get("lease") or {}).get("owner")
+        if owner != worker_id:
+            logger.warning(f"Lease of post {post.get('id')} was taken over by {owner}, leaving it")
+            return
+
+        queued["status"] = "failed"
+        queued["error_at"] = datetime.now(ZoneInfo(TIMEZONE)).isoformat()
+        queued.pop("lease", None)
+
+
+def process_queue(worker_id: str = None) -> int:
+    """Claim and post due content until nothing is left, return posts sent."""
+    worker_id = worker_id or worker_name()
+    sent = 0
+
+    while True:
+        post = claim_next_post(worker_id)
+        if post is None:
+            break
+
+        try:
+            success = deliver_post(worker_id, post)
+        except LeaseLost as e:
+            logger.warning(f"Gave up post {post.get('id')}: {e}")
+            continue
+        except Exception as e:
+            logger.error(f"Failed to deliver post {post.get('id')}: {e}")
             success = False
-            image_url = post.get("image_url")
-            text = post.get("text", "")
-
-            if image_url:
-                success = send_photo(image_url, text)
-            elif text:
-                success = send_message(text)
-
-            if success:
-                post["status"] = "posted"
-                post["posted_at"] = now.isoformat()
-                archive_post(post)
-                posts_to_remove.append(i)
-            else:
-                post["status"] = "failed"
-                post["error_at"] = now.isoformat()
 
-    # Remove posted items
-    for i in sorted(posts_to_remove, reverse=True):
-        queue["posts"].pop(i)
+        finish_post(worker_id, post, success)
+        sent += success
+
+    return sent
 
-    save_queue(queue)
+
+def positive_int(value: str) -> int:
+    """argparse type: integer greater than zero."""
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"must be > 0, got {value}")
+    return number
 
 
 def main():
     """Main entry point."""
+    parser = argparse.ArgumentParser(description="Post scheduled content to @sys_adm channel")
+    parser.add_argument("--workers", "-w", type=positive_int, default=1, help="Parallel workers (default 1)")
+    args = parser.parse_args()
+
     logger.info("Starting queue processing...")
-    process_queue()
-    logger.info("Queue processing complete")
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        sent = sum(pool.map(lambda n: process_queue(worker_name(n)), range(args.workers)))
+    logger.info(f"Queue processing complete, posted {sent}")
 
 
 if __name__ == "__main__":
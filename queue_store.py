@@ -0,0 +1,67 @@
+"""
+Shared access to queue.json.
+
+Every read-modify-write of the queue runs under queue_lock() (or the
+locked_queue() shortcut), which holds an exclusive flock on queue.json.lock.
+Posters on several hosts sharing the same storage (local disk or NFSv4)
+serialize on this lock, so lease claims and edits from the bot or add_post.py
+never overwrite each other.
+"""
+
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+from config import QUEUE_FILE
+
+LOCK_FILE = f"{QUEUE_FILE}.lock"
+
+
+def load_queue() -> dict:
+    """Load queue from JSON file."""
+    if not Path(QUEUE_FILE).exists():
+        return {"posts": []}
+
+    with open(QUEUE_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_queue(queue: dict) -> None:
+    """Save queue to JSON file atomically, readers never see a partial file."""
+    tmp_file = f"{QUEUE_FILE}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(queue, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, QUEUE_FILE)
+
+
+def has_active_lease(post: dict) -> bool:
+    """Check if a poster worker currently holds the post."""
+    lease = post.get("lease")
+    if not lease:
+        return False
+    return datetime.fromisoformat(lease["expires_at"]) > datetime.now(timezone.utc)
+
+
+@contextmanager
+def queue_lock():
+    """Hold exclusive lock on the queue. Not reentrant."""
+    with open(LOCK_FILE, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+@contextmanager
+def locked_queue():
+    """Load queue under lock and save it back when the block succeeds."""
+    with queue_lock():
+        queue = load_queue()
+        yield queue
+        save_queue(queue)
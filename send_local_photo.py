@@ -1,12 +1,67 @@
 #!/usr/bin/env python3
-"""Send local photo to channel."""
+"""
+Send local photo to channel.
 
+Usage:
+    # Single photo
+    python send_local_photo.py photo.jpg "Caption"
+
+    # Bulk: every image in a directory, caption from photo.txt next to photo.jpg
+    python send_local_photo.py --bulk images/
+
+    # Bulk: manifest, JSON lines {"path": ..., "caption": ...} or CSV path,caption
+    python send_local_photo.py --bulk manifest.jsonl --concurrency 4 --rate 20
+
+Bulk runs write a progress journal; running the same command again skips
+everything already sent. Photos are sent concurrently, so use
+--concurrency 1 if channel order matters.
+
+A request that may have reached Telegram (timeout after connecting, 5xx) is
+never retried: the photo is journaled as uncertain and skipped on resume.
+Check the channel and delete its journal line to send it again.
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
 import sys
+import time
+from pathlib import Path
+
 import httpx
 from config import BOT_TOKEN, CHANNEL_ID
 
 API_URL = f"https://api.telegram.org/bot{BOT_TOKEN}"
 
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif"}
+
+# Telegram allows about 20 messages per minute to the same chat
+DEFAULT_RATE = 20
+DEFAULT_CONCURRENCY = 4
+MAX_ATTEMPTS = 5
+
+
+class UncertainDelivery(Exception):
+    """Request may have been delivered, resending could post a duplicate."""
+
+
+def positive_int(value: str) -> int:
+    """argparse type: integer greater than zero."""
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"must be > 0, got {value}")
+    return number
+
+
+def positive_float(value: str) -> float:
+    """argparse type: number greater than zero."""
+    number = float(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"must be > 0, got {value}")
+    return number
+
 
 def send_local_photo(file_path: str, caption: str = None) -> bool:
     """Send local photo file to channel."""
@@ -31,12 +86,255 @@ def send_local_photo(file_path: str, caption: str = None) -> bool:
         return False
 
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: send_local_photo.py <file_path> [caption]")
-        sys.exit(1)
+def load_manifest(source: str) -> list:
+    """Load [{"path", "caption"}] from a directory, JSON lines or CSV manifest."""
+    source_path = Path(source)
+
+    if source_path.is_dir():
+        items = []
+        for path in sorted(source_path.iterdir()):
+            if path.suffix.lower() not in IMAGE_EXTENSIONS:
+                continue
+            caption_file = path.with_suffix(".txt")
+            caption = caption_file.read_text(encoding='utf-8').strip() if caption_file.exists() else None
+            items.append({"path": str(path), "caption": caption})
+        return items
+
+    base_dir = source_path.parent
+    with open(source_path, 'r', encoding='utf-8') as f:
+        if source_path.suffix.lower() == ".csv":
+            rows = [
+                {"path": row[0], "caption": row[1] if len(row) > 1 else None}
+                for row in csv.reader(f) if row
+            ]
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    # Relative paths are relative to the manifest
+    return [
+        {"path": str(base_dir / row["path"]), "caption": row.get("caption") or None}
+        for row in rows
+    ]
+
+
+def default_journal(source: str) -> Path:
+    """Journal file next to the bulk source."""
+    source_path = Path(source)
+    if source_path.is_dir():
+        return source_path / ".send_journal.jsonl"
+    return source_path.with_name(source_path.name + ".journal.jsonl")
+
+
+def journal_key(path: str, source: str) -> str:
+    """Journal key of a photo: path relative to the bulk source.
+
+    Stays the same whether the source was given as relative or absolute path.
+    """
+    source_path = Path(source).resolve()
+    base_dir = source_path if source_path.is_dir() else source_path.parent
+    resolved = Path(path).resolve()
+    try:
+        return str(resolved.relative_to(base_dir))
+    except ValueError:
+        # Manifest entry outside the manifest directory
+        return str(resolved)
+
+
+def load_journal(journal_file: Path) -> set:
+    """Journal keys of photos already sent or possibly sent."""
+    if not journal_file.exists():
+        return set()
+
+    sent = set()
+    with open(journal_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                sent.add(json.loads(line)["key"])
+            except (ValueError, KeyError):
+                # Last line may be cut by a crash
+                continue
+    return sent
+
+
+class RateLimiter:
+    """Spaces requests evenly and pauses everyone on Telegram flood waits."""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60 / per_minute
+        self.next_slot = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self.lock:
+            now = time.monotonic()
+            delay = self.next_slot - now
+            self.next_slot = max(now, self.next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float) -> None:
+        self.next_slot = max(self.next_slot, time.monotonic() + seconds)
 
-    file_path = sys.argv[1]
-    caption = sys.argv[2] if len(sys.argv) > 2 else None
 
-    send_local_photo(file_path, caption)
+async def send_bulk_item(client: httpx.AsyncClient, limiter: RateLimiter, item: dict) -> tuple:
+    """Send one photo, retrying only requests that surely never arrived.
+
+    Returns (Telegram message, duration of the successful HTTP request,
+    total time spent waiting for the rate limiter).
+    """
+    photo_data = await asyncio.to_thread(Path(item["path"]).read_bytes)
+    data = {"chat_id": CHANNEL_ID}
+    if item["caption"]:
+        data["caption"] = item["caption"]
+
+    waited = 0.0
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        wait_started = time.monotonic()
+        await limiter.wait()
+        waited += time.monotonic() - wait_started
+
+        request_started = time.monotonic()
+        try:
+            response = await client.post(
+                f"{API_URL}/sendPhoto",
+                data=data,
+                files={"photo": (Path(item["path"]).name, photo_data)}
+            )
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+            # Connection was never made, Telegram has not seen the request
+            if attempt == MAX_ATTEMPTS:
+                raise
+            await asyncio.sleep(2 ** attempt)
+            continue
+        except httpx.TransportError as e:
+            # Read/write timeout or broken response: the photo may be posted
+            raise UncertainDelivery(f"{type(e).__name__}: {e}") from e
+
+        if response.status_code == 429:
+            # Flood wait: Telegram rejected the request, safe to repeat
+            retry_after = response.json().get("parameters", {}).get("retry_after", 5)
+            limiter.pause(retry_after)
+            continue
+        if response.status_code >= 500:
+            raise UncertainDelivery(f"HTTP {response.status_code}")
+
+        response.raise_for_status()
+        return response.json()["result"], time.monotonic() - request_started, waited
+
+    raise RuntimeError(f"Gave up after {MAX_ATTEMPTS} attempts")
+
+
+def write_journal(journal, entry: dict) -> None:
+    """Append journal entry and make it durable."""
+    journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    journal.flush()
+    os.fsync(journal.fileno())
+
+
+async def send_bulk(source: str, concurrency: int = DEFAULT_CONCURRENCY,
+                    rate: float = DEFAULT_RATE, journal_file: str = None) -> dict:
+    """Send all photos from a directory or manifest, resuming from journal."""
+    items = load_manifest(source)
+    for item in items:
+        item["key"] = journal_key(item["path"], source)
+    journal_file = Path(journal_file) if journal_file else default_journal(source)
+    already_sent = load_journal(journal_file)
+    todo = [item for item in items if item["key"] not in already_sent]
+
+    print(f"→ {len(items)} photos, {len(items) - len(todo)} already sent, {len(todo)} to send")
+
+    stats = {"sent": 0, "failed": 0, "uncertain": 0, "skipped": len(items) - len(todo), "bytes": 0, "latencies": [], "waits": []}
+    limiter = RateLimiter(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.monotonic()
+
+    async def worker(client: httpx.AsyncClient, journal, item: dict) -> None:
+        async with semaphore:
+            try:
+                message, latency, waited = await send_bulk_item(client, limiter, item)
+            except UncertainDelivery as e:
+                stats["uncertain"] += 1
+                write_journal(journal, {
+                    "key": item["key"],
+                    "path": item["path"],
+                    "uncertain": True,
+                    "error": str(e),
+                    "sent_at": time.time()
+                })
+                print(f"? {item['path']}: may have been posted ({e}), not retrying")
+                return
+            except Exception as e:
+                stats["failed"] += 1
+                print(f"✗ {item['path']}: {e}")
+                return
+
+            stats["latencies"].append(latency)
+            stats["waits"].append(waited)
+            stats["sent"] += 1
+            stats["bytes"] += os.path.getsize(item["path"])
+
+            # Record right away so an interrupted run never re-sends this photo
+            write_journal(journal, {
+                "key": item["key"],
+                "path": item["path"],
+                "message_id": message.get("message_id"),
+                "sent_at": time.time()
+            })
+            print(f"✓ [{stats['sent'] + stats['skipped']}/{len(items)}] {item['path']}")
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+        with open(journal_file, 'a', encoding='utf-8') as journal:
+            await asyncio.gather(*(worker(client, journal, item) for item in todo))
+
+    stats["elapsed"] = time.monotonic() - started
+    return stats
+
+
+def print_summary(stats: dict) -> None:
+    """Print throughput/latency summary of a bulk run."""
+    elapsed = stats["elapsed"]
+    print(f"\nSent: {stats['sent']}, failed: {stats['failed']}, "
+          f"uncertain: {stats['uncertain']}, skipped: {stats['skipped']}")
+    if stats["uncertain"]:
+        print("Uncertain photos may be posted: check the channel, "
+              "delete their journal lines to send them again")
+    print(f"Elapsed: {elapsed:.1f}s")
+    if stats["sent"] and elapsed > 0:
+        print(f"Throughput: {stats['sent'] / elapsed * 60:.1f} photos/min, "
+              f"{stats['bytes'] / elapsed / 1024 / 1024:.2f} MB/s")
+
+    latencies = sorted(stats["latencies"])
+    if latencies:
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"Request latency: p50 {p50:.2f}s, p95 {p95:.2f}s, max {latencies[-1]:.2f}s")
+        print(f"Rate limit wait: avg {sum(stats['waits']) / len(stats['waits']):.2f}s per photo")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send local photos to @sys_adm channel")
+    parser.add_argument("file_path", nargs="?", help="Photo to send")
+    parser.add_argument("caption", nargs="?", help="Photo caption")
+    parser.add_argument("--bulk", "-b", help="Directory or manifest (.jsonl/.csv) to send")
+    parser.add_argument("--concurrency", "-c", type=positive_int, default=DEFAULT_CONCURRENCY,
+                        help=f"Parallel uploads (default {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--rate", "-r", type=positive_float, default=DEFAULT_RATE,
+                        help=f"Max photos per minute (default {DEFAULT_RATE})")
+    parser.add_argument("--journal", "-j", help="Progress journal file (default next to source)")
+
+    args = parser.parse_args()
+
+    if args.bulk:
+        stats = asyncio.run(send_bulk(args.bulk, args.concurrency, args.rate, args.journal))
+        print_summary(stats)
+        sys.exit(1 if stats["failed"] or stats["uncertain"] else 0)
+
+    if not args.file_path:
+        parser.error("file_path or --bulk is required")
+
+    send_local_photo(args.file_path, args.caption)
+
+
+if __name__ == "__main__":
+    main()
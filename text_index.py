@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+MinHash/LSH index of queued and posted texts.
+
+Each text is cut into character shingles and summarised by a MinHash
+signature. Signatures are split into LSH bands, so a query only compares
+against posts sharing at least one band instead of the whole history.
+
+Usage:
+    # Rebuild index from queue.json and posted/ archive
+    python text_index.py --rebuild
+
+    # Find posts similar to a text
+    python text_index.py --query "Post text"
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+from pathlib import Path
+
+from config import POSTED_DIR, QUEUE_FILE, TEXT_INDEX_FILE
+
+# Characters per shingle
+SHINGLE_SIZE = 5
+
+# MinHash signature length = LSH_BANDS * LSH_ROWS
+# 32 bands of 4 rows make texts with ~40%+ similarity likely candidates
+LSH_BANDS = 32
+LSH_ROWS = 4
+NUM_PERM = LSH_BANDS * LSH_ROWS
+
+# Estimated Jaccard similarity treated as "nearly the same post"
+DUPLICATE_SIMILARITY = 0.5
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20260205)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, drop HTML tags and punctuation, collapse whitespace."""
+    text = re.sub(r"<[^>]+>", " ", text.lower())
+    return " ".join(re.findall(r"\w+", text))
+
+
+def shingles(text: str) -> set:
+    """Character shingles of normalized text."""
+    text = normalize_text(text)
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text: str) -> list:
+    """MinHash signature of a text (32-bit values), None if it has no words."""
+    hashes = [
+        int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+        for s in shingles(text)
+    ]
+    if not hashes:
+        return None
+    return [
+        min((a * h + b) % _PRIME for h in hashes) & 0xFFFFFFFF
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def similarity(sig_a: list, sig_b: list) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / NUM_PERM
+
+
+def band_keys(signature: list) -> list:
+    """LSH bucket keys of a signature, one per band."""
+    return [
+        (band, tuple(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]))
+        for band in range(LSH_BANDS)
+    ]
+
+
+class TextIndex:
+    """Persistent key -> MinHash index with LSH candidate lookup."""
+
+    def __init__(self, texts: dict = None):
+        # key -> {"signature": [...], "post_id": int, "status": "queued" | "posted", "preview": str}
+        self.texts = texts or {}
+        self.buckets = {}
+        for key, entry in self.texts.items():
+            self._add_to_buckets(key, entry["signature"])
+
+    def _add_to_buckets(self, key: str, signature: list) -> None:
+        for band_key in band_keys(signature):
+            self.buckets.setdefault(band_key, set()).add(key)
+
+    def _remove_from_buckets(self, key: str, signature: list) -> None:
+        for band_key in band_keys(signature):
+            bucket = self.buckets.get(band_key)
+            if bucket:
+                bucket.discard(key)
+                if not bucket:
+                    del self.buckets[band_key]
+
+    @classmethod
+    def load(cls) -> "TextIndex":
+        """Load index from JSON file."""
+        if not Path(TEXT_INDEX_FILE).exists():
+            return cls()
+        with open(TEXT_INDEX_FILE, 'r', encoding='utf-8') as f:
+            return cls(json.load(f).get("texts", {}))
+
+    def save(self) -> None:
+        """Save index to JSON file atomically."""
+        tmp_file = f"{TEXT_INDEX_FILE}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({"texts": self.texts}, f, ensure_ascii=False)
+        os.replace(tmp_file, TEXT_INDEX_FILE)
+
+    def add(self, key: str, text: str, post_id: int = None, status: str = "queued",
+            signature: list = None) -> list:
+        """Add or replace text under key, return its signature.
+
+        Texts without words (empty, punctuation only) are not indexed.
+        """
+        self.remove(key)
+        if signature is None:
+            signature = minhash(text)
+        if signature is None:
+            return None
+        self.texts[key] = {
+            "signature": signature,
+            "post_id": post_id,
+            "status": status,
+            "preview": text[:100]
+        }
+        self._add_to_buckets(key, signature)
+        return signature
+
+    def remove(self, key: str) -> None:
+        """Remove text from index."""
+        entry = self.texts.pop(key, None)
+        if entry:
+            self._remove_from_buckets(key, entry["signature"])
+
+    def rename(self, old_key: str, new_key: str, status: str) -> None:
+        """Move entry to a new key, e.g. when a queued post gets archived."""
+        entry = self.texts.get(old_key)
+        if not entry:
+            return
+        self.remove(old_key)
+        entry["status"] = status
+        self.texts[new_key] = entry
+        self._add_to_buckets(new_key, entry["signature"])
+
+    def find_similar(self, text: str = None, signature: list = None, limit: int = 5,
+                     min_similarity: float = 0.0, exclude_key: str = None) -> list:
+        """Return [{"key", "similarity", "post_id", "status", "preview"}], most similar first."""
+        if signature is None:
+            signature = minhash(text or "")
+        if signature is None:
+            # Nothing to compare, every wordless text would look identical
+            return []
+
+        candidates = set()
+        for band_key in band_keys(signature):
+            candidates |= self.buckets.get(band_key, set())
+        candidates.discard(exclude_key)
+
+        result = []
+        for key in candidates:
+            entry = self.texts[key]
+            score = similarity(signature, entry["signature"])
+            if score >= min_similarity:
+                result.append({
+                    "key": key,
+                    "similarity": score,
+                    "post_id": entry["post_id"],
+                    "status": entry["status"],
+                    "preview": entry["preview"]
+                })
+
+        result.sort(key=lambda r: r["similarity"], reverse=True)
+        return result[:limit]
+
+
+_cached_index = None
+_cached_mtime = None
+
+
+def get_text_index() -> TextIndex:
+    """Return index, re-reading the file only when another process changed it."""
+    global _cached_index, _cached_mtime
+
+    try:
+        mtime = os.stat(TEXT_INDEX_FILE).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+
+    if _cached_index is None or mtime != _cached_mtime:
+        _cached_index = TextIndex.load()
+        _cached_mtime = mtime
+    return _cached_index
+
+
+def save_text_index(index: TextIndex) -> None:
+    """Save index and remember its mtime so the cache stays valid."""
+    global _cached_index, _cached_mtime
+
+    index.save()
+    _cached_index = index
+    _cached_mtime = os.stat(TEXT_INDEX_FILE).st_mtime_ns
+
+
+def queued_key(post_id: int) -> str:
+    """Index key of a queued post."""
+    return f"queue:{post_id}"
+
+
+def posted_key(archive_file: Path) -> str:
+    """Index key of an archived post."""
+    return f"posted:{Path(archive_file).stem}"
+
+
+def rebuild_index() -> TextIndex:
+    """Rebuild index from queued posts and the posted archive."""
+    index = TextIndex()
+
+    if Path(QUEUE_FILE).exists():
+        with open(QUEUE_FILE, 'r', encoding='utf-8') as f:
+            for post in json.load(f).get("posts", []):
+                if post.get("text"):
+                    index.add(queued_key(post.get("id")), post["text"], post.get("id"))
+
+    for archive_file in sorted(Path(POSTED_DIR).glob("post_*.json")):
+        with open(archive_file, 'r', encoding='utf-8') as f:
+            post = json.load(f)
+        if post.get("text"):
+            index.add(posted_key(archive_file), post["text"], post.get("id"), "posted")
+
+    save_text_index(index)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MinHash/LSH index of post texts")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild index from queue and archive")
+    parser.add_argument("--query", "-q", help="Find posts similar to this text")
+    parser.add_argument("--limit", type=int, default=5, help="Max results (default 5)")
+
+    args = parser.parse_args()
+    if not args.rebuild and not args.query:
+        parser.error("nothing to do, use --rebuild or --query")
+
+    if args.rebuild:
+        index = rebuild_index()
+        print(f"✓ Indexed {len(index.texts)} texts")
+
+    if args.query:
+        matches = get_text_index().find_similar(args.query, limit=args.limit)
+        if not matches:
+            print("✓ No similar posts")
+        for match in matches:
+            print(f"  {match['similarity']:.0%}  #{match['post_id']} ({match['status']})  {match['preview'][:60]}")
+
+
+if __name__ == "__main__":
+    main()